@@ -51,6 +51,11 @@ Config file:
     disable.  To find out the right values, use --keep and take a look at
     text coordinates in the intermediate .xml file.
 
+    For batch conversions you can limit the resources pdftohtml may use:
+    timeout (seconds of wall-clock time), cpu_limit (seconds of CPU time),
+    memory_limit (megabytes) and max_xml_size (megabytes of intermediate
+    XML).  Specify -1 (which is the default) to disable each of them.
+
 Bugs:
 
     There are no tests.
@@ -66,15 +71,22 @@ Licenced under the GNU GPL.
 import optparse
 import os
 import shutil
+import signal
 import subprocess
 import sys
 import tempfile
+import time
 import ConfigParser
 import fnmatch
 import re
 from collections import defaultdict
 from xml.etree import cElementTree as ET
 
+try:
+    import resource
+except ImportError: # not on Unix
+    resource = None
+
 
 __version__ = '0.7dev'
 __author__ = 'Marius Gedminas'
@@ -84,6 +96,26 @@ class Error(Exception):
     pass
 
 
+class ResourceLimitExceeded(Error):
+    """pdftohtml was aborted because it exceeded a resource limit"""
+
+
+class ConversionTimeout(ResourceLimitExceeded):
+    """pdftohtml ran for longer than --timeout seconds"""
+
+
+class CPULimitExceeded(ResourceLimitExceeded):
+    """pdftohtml used more than --cpu-limit seconds of CPU time"""
+
+
+class MemoryLimitExceeded(ResourceLimitExceeded):
+    """pdftohtml (probably) ran out of --memory-limit megabytes"""
+
+
+class OutputTooLarge(ResourceLimitExceeded):
+    """the intermediate XML file grew larger than --max-xml-size megabytes"""
+
+
 class NotFound(object):
     def __repr__(self):
         return 'NotFound'
@@ -106,6 +138,10 @@ class Options(object):
         ('skip_initial_pages', int),
         ('skip_generator', bool),
         ('encoding', str),
+        ('timeout', int),
+        ('cpu_limit', int),
+        ('memory_limit', int),
+        ('max_xml_size', int),
     ]
 
     _skip_from_skeleton = ('debug', 'keep')
@@ -124,6 +160,10 @@ class Options(object):
         skip_initial_pages='skip the first N pages of output',
         skip_generator='skip <meta name="generator" ...>',
         encoding='character set for the HTML',
+        timeout='kill pdftohtml after N seconds of wall-clock time',
+        cpu_limit='kill pdftohtml after N seconds of CPU time',
+        memory_limit='limit pdftohtml to N megabytes of memory',
+        max_xml_size='abort if the intermediate XML exceeds N megabytes',
     )
 
     _defaults = dict(
@@ -184,12 +224,145 @@ def parse_config_file(options, config_file, filename_to_match='*'):
             options.update_from_config_section(cp, s)
 
 
+def _limit(opts, name):
+    """Return the value of a resource limit option, or None if disabled."""
+    value = getattr(opts, name, None) if opts else None
+    if value is None or value <= 0:
+        return None
+    return value
+
+
+def _make_preexec_fn(cpu_limit, memory_bytes, max_xml_bytes):
+    """Build a preexec_fn that applies RLIMITs to the pdftohtml process."""
+    if resource is None:
+        return None
+    limits = []
+    if cpu_limit:
+        # SIGXCPU at the soft limit, SIGKILL one second later
+        limits.append((resource.RLIMIT_CPU, cpu_limit, cpu_limit + 1))
+    if memory_bytes:
+        limits.append((resource.RLIMIT_AS, memory_bytes, memory_bytes))
+    if max_xml_bytes:
+        # SIGXFSZ as soon as any single output file grows too large; this
+        # applies to every file pdftohtml writes, which is why we pass -i
+        limits.append((resource.RLIMIT_FSIZE, max_xml_bytes, max_xml_bytes))
+    if not limits:
+        return None
+    # SIGXCPU, SIGXFSZ and SIGABRT all dump core by default
+    limits.append((resource.RLIMIT_CORE, 0, 0))
+
+    def preexec_fn():
+        # Python ignores SIGXFSZ, and the child inherits that
+        signal.signal(signal.SIGXFSZ, signal.SIG_DFL)
+        for which, soft, hard in limits:
+            # we're not allowed to raise the hard limit we were given
+            cur_soft, cur_hard = resource.getrlimit(which)
+            if cur_hard != resource.RLIM_INFINITY:
+                soft = min(soft, cur_hard)
+                hard = min(hard, cur_hard)
+            resource.setrlimit(which, (soft, hard))
+    return preexec_fn
+
+
+def _wait(proc, block=True, rusage=False):
+    """Wait for proc like Popen.wait(), or like Popen.poll() if not block.
+
+    If rusage is true, reaps proc with os.wait4() (Unix-only) and returns
+    its resource usage; otherwise returns None.  Check proc.returncode to
+    see whether proc has finished.
+    """
+    if not rusage:
+        if block:
+            proc.wait()
+        else:
+            proc.poll()
+        return None
+    pid, status, usage = os.wait4(proc.pid, 0 if block else os.WNOHANG)
+    if pid == 0:
+        return None
+    if os.WIFSIGNALED(status):
+        proc.returncode = -os.WTERMSIG(status)
+    else:
+        proc.returncode = os.WEXITSTATUS(status)
+    return usage
+
+
+def run_pdftohtml(pdf_file, xml_file, opts=None):
+    """Run pdftohtml -xml, enforcing the resource limits from opts.
+
+    Raises a subclass of ResourceLimitExceeded if any of the limits are
+    hit, or subprocess.CalledProcessError if pdftohtml fails otherwise.
+    """
+    timeout = _limit(opts, 'timeout')
+    cpu_limit = _limit(opts, 'cpu_limit')
+    memory_limit = _limit(opts, 'memory_limit')
+    max_xml_size = _limit(opts, 'max_xml_size')
+    if resource is None:
+        # RLIMITs are Unix-only; --timeout and --max-xml-size still work
+        cpu_limit = memory_limit = None
+    memory_bytes = memory_limit and memory_limit * 1024 * 1024
+    max_xml_bytes = max_xml_size and max_xml_size * 1024 * 1024
+    cmd = ['pdftohtml', '-hidden', '-nodrm', '-xml']
+    if max_xml_size:
+        # we never use the images, and they'd count against RLIMIT_FSIZE
+        cmd.append('-i')
+    cmd += [pdf_file, xml_file]
+    proc = subprocess.Popen(cmd, preexec_fn=_make_preexec_fn(
+        cpu_limit, memory_bytes, max_xml_bytes))
+    # pdf2html always adds .xml
+    output_file = xml_file + '.xml'
+    # we need the CPU time to tell a CPU limit SIGKILL from other ones
+    want_rusage = bool(cpu_limit)
+    try:
+        if not timeout and not max_xml_size:
+            rusage = _wait(proc, rusage=want_rusage)
+        else:
+            started = time.time()
+            while True:
+                rusage = _wait(proc, block=False, rusage=want_rusage)
+                if proc.returncode is not None:
+                    break
+                if timeout and time.time() - started > timeout:
+                    raise ConversionTimeout(
+                        'pdftohtml did not finish in %d seconds' % timeout)
+                if (max_xml_size and os.path.exists(output_file) and
+                        os.path.getsize(output_file) > max_xml_bytes):
+                    raise OutputTooLarge(
+                        'pdftohtml produced more than %d MB of XML'
+                        % max_xml_size)
+                time.sleep(0.1)
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+            _wait(proc)
+    retcode = proc.returncode
+    if retcode == 0:
+        return
+    if cpu_limit and (retcode == -signal.SIGXCPU or
+                      retcode == -signal.SIGKILL and
+                      rusage.ru_utime + rusage.ru_stime >= cpu_limit):
+        raise CPULimitExceeded(
+            'pdftohtml used more than %d seconds of CPU time' % cpu_limit)
+    if max_xml_size and (resource is not None and
+                         retcode == -signal.SIGXFSZ or
+                         os.path.exists(output_file) and
+                         os.path.getsize(output_file) >= max_xml_bytes):
+        raise OutputTooLarge(
+            'pdftohtml produced more than %d MB of XML' % max_xml_size)
+    if memory_limit and retcode == -signal.SIGABRT:
+        # an uncaught std::bad_alloc aborts; a SIGSEGV is far more likely
+        # to be a plain crash on a malformed PDF, so we don't count it
+        raise MemoryLimitExceeded(
+            'pdftohtml aborted, probably by running out of %d MB of memory'
+            % memory_limit)
+    raise subprocess.CalledProcessError(retcode, cmd)
+
+
 def convert_pdf_to_html(pdf_file, html_file, opts=None):
     tmpdir = tempfile.mkdtemp(prefix='pdf2html-')
     try:
         xml_file = os.path.join(tmpdir, 'data') # pdf2html always adds .xml
-        subprocess.check_call(['pdftohtml', '-hidden', '-nodrm', '-xml',
-                               pdf_file, xml_file])
+        run_pdftohtml(pdf_file, xml_file, opts)
         xml_file += '.xml'
         convert_pdfxml_to_html(xml_file, html_file, opts)
     finally:
@@ -204,6 +377,12 @@ def convert_pdfxml_to_html(xml_file, html_file, opts=None):
     if opts:
         debug = opts.debug
 
+    max_xml_size = _limit(opts, 'max_xml_size')
+    max_xml_bytes = max_xml_size and max_xml_size * 1024 * 1024
+    if max_xml_size and os.path.getsize(xml_file) > max_xml_bytes:
+        raise OutputTooLarge('%s is larger than %d MB' % (xml_file,
+                                                         max_xml_size))
+
     # The structure of the pdf2xml documents is this:
     #   <pdf2xml>
     #     <page number="1" position="absolute" top="0" left="0"